@@ -1,49 +1,134 @@
+import math
+import warnings
 import numpy as np
-from collections import defaultdict
+
+# Atom type names fill at most ATOM_TYPE_WIDTH - 1 characters, so a full field means it was cut off
+ATOM_TYPE_WIDTH = 32
+ATOM_SITES_DTYPE = [('atom_type', f'U{ATOM_TYPE_WIDTH}'), ('x', 'f8'), ('y', 'f8'), ('z', 'f8')]
 
 def read_atom_sites(file_path):
-    coordinates = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= 5:
-                # Extract atom type and coordinates
-                atom_type = parts[0]
-                try:
-                    x, y, z = float(parts[2]), float(parts[3]), float(parts[4])
-                    coordinates.append((atom_type, (x, y, z)))
-                except (ValueError, IndexError):
-                    print(f"Skipping malformed line: {line.strip()}")
-    return coordinates
+    """Read atom types and fractional coordinates as contiguous (N,) and (N, 3) arrays"""
+    try:
+        data = np.loadtxt(file_path, usecols=(0, 2, 3, 4), dtype=ATOM_SITES_DTYPE, ndmin=1,
+                          comments=None)
+    except ValueError:
+        # Malformed rows: let genfromtxt drop short lines and mark bad floats as NaN.
+        # It iterates lines in Python, so feed it the file read into memory in one go.
+        with open(file_path, 'rb') as f:
+            lines = f.read().splitlines()
+        # Bad values are reported below and short rows are skipped silently, as before, so hide
+        # genfromtxt's ConversionWarning (a UserWarning that NumPy only exposes from a private module)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='Some errors were detected', category=UserWarning)
+            data = np.atleast_1d(np.genfromtxt(lines, usecols=(0, 2, 3, 4), dtype=ATOM_SITES_DTYPE,
+                                               encoding='utf-8', comments=None, invalid_raise=False))
+    # Split the parsed records into one array per field (structure of arrays)
+    types = np.ascontiguousarray(data['atom_type'])
+    if len(types) and np.char.str_len(types).max() >= ATOM_TYPE_WIDTH:
+        raise ValueError(f"Atom type names in {file_path} are longer than {ATOM_TYPE_WIDTH - 1} characters")
+    coords = np.column_stack((data['x'], data['y'], data['z']))
+    valid = ~np.isnan(coords).any(axis=1)
+    if not valid.all():
+        print(f"Skipping {np.count_nonzero(~valid)} malformed line(s) in {file_path}")
+        types, coords = types[valid], coords[valid]
+    return types, coords
+
+def encode_types(*type_arrays):
+    """Shared sorted table of type names plus integer codes for each input array"""
+    # One code space for all inputs, so packed keys built from different files compare directly
+    type_names, codes = np.unique(np.concatenate(type_arrays), return_inverse=True)
+    return type_names, np.split(codes, np.cumsum([len(types) for types in type_arrays[:-1]]))
+
+def count_atom_types(type_codes, type_names):
+    """Number of atoms of each type present, keyed by type name"""
+    counts = np.bincount(type_codes, minlength=len(type_names))
+    present = np.flatnonzero(counts)
+    return dict(zip(type_names[present].tolist(), counts[present].tolist()))
+
+# Packed histogram keys: atom type code in the top bits, then one biased
+# 16-bit field per axis so that keys sort like (type, ix, iy, iz) tuples
+BIN_SIZE = 0.01
+INV_BIN_SIZE = 1.0 / BIN_SIZE
+AXIS_BITS = 16
+AXIS_BIAS = 1 << (AXIS_BITS - 1)
+AXIS_MASK = (1 << AXIS_BITS) - 1
+TYPE_SHIFT = 3 * AXIS_BITS
+# Count on a dense np.bincount grid unless it has this many more cells than atoms
+DENSE_GRID_FACTOR = 32
+# Exact (unbinned) match keys: type code plus coordinates scaled to integers
+DIRECT_MATCH_SCALE = 1e9
+DIRECT_KEY_DTYPE = np.dtype([('type', 'i8'), ('x', 'i8'), ('y', 'i8'), ('z', 'i8')])
 
-def build_coordinate_histogram(coordinates, bin_size=0.01):
-    """Group coordinates into bins to compare distributions"""
-    histogram = defaultdict(int)
-    for atom_type, (x, y, z) in coordinates:
-        # Round coordinates to create bins
-        binned_coords = (round(x/bin_size)*bin_size, 
-                        round(y/bin_size)*bin_size, 
-                        round(z/bin_size)*bin_size)
-        # Store as atom_type + coordinates
-        key = (atom_type, binned_coords)
-        histogram[key] += 1
-    return histogram
+def bin_uniform(coords, inv_bin_size=INV_BIN_SIZE):
+    """Biased integer bin index (key field) of each coordinate on a uniform grid, rounding halves up"""
+    # Adding the bias keeps every value positive, so truncating with astype rounds without a branch
+    scaled = coords * inv_bin_size + (AXIS_BIAS + 0.5)
+    if len(scaled) and (scaled.min() < 0 or scaled.max() >= 1 << AXIS_BITS):
+        raise ValueError("Bin indices do not fit in packed histogram keys")
+    return scaled.astype(np.int32)
+
+def pack_keys(type_codes, fields):
+    """Pack type codes and (N, 3) biased bin indices into one int64 key per atom"""
+    fields = fields.astype(np.int64)
+    return ((type_codes.astype(np.int64) << TYPE_SHIFT) | (fields[:, 0] << (2 * AXIS_BITS))
+            | (fields[:, 1] << AXIS_BITS) | fields[:, 2])
+
+def unpack_keys(keys):
+    """Split packed keys back into (type_codes, bins)"""
+    bins = np.column_stack([(keys >> (shift * AXIS_BITS)) & AXIS_MASK for shift in (2, 1, 0)])
+    return keys >> TYPE_SHIFT, bins - AXIS_BIAS
+
+def direct_keys(type_codes, coords):
+    """One structured key per atom for exact coordinate matching"""
+    rows = np.empty((len(coords), 4), dtype=np.int64)
+    rows[:, 0] = type_codes
+    rows[:, 1:] = np.rint(coords * DIRECT_MATCH_SCALE)
+    return rows.view(DIRECT_KEY_DTYPE).ravel()
+
+def build_coordinate_histogram(type_codes, coords, bin_size=BIN_SIZE, n_types=None):
+    """Group coordinates into bins; returns sorted packed keys and their counts"""
+    # Histograms are only comparable if their type codes come from the same type_names
+    if n_types is None:
+        n_types = int(type_codes.max()) + 1 if len(type_codes) else 0
+    bins = bin_uniform(coords, 1.0 / bin_size)
+    if not len(bins):
+        return pack_keys(type_codes, bins), np.zeros(0, dtype=np.intp)
+    
+    origin = bins.min(axis=0)
+    shape = (n_types,) + tuple((bins.max(axis=0) - origin + 1).tolist())
+    if math.prod(shape) > DENSE_GRID_FACTOR * len(bins):
+        # Sparse grid: sorting the keys is cheaper than a mostly empty bincount
+        return np.unique(pack_keys(type_codes, bins), return_counts=True)
+    
+    # Dense grid: count over (type, ix, iy, iz) linearized in key order
+    local = bins - origin
+    flat = np.ravel_multi_index((type_codes, local[:, 0], local[:, 1], local[:, 2]), shape)
+    counts = np.bincount(flat, minlength=math.prod(shape))
+    occupied = np.flatnonzero(counts)
+    occupied_codes, ix, iy, iz = np.unravel_index(occupied, shape)
+    return pack_keys(occupied_codes, np.column_stack((ix, iy, iz)) + origin), counts[occupied]
+
+def align_histograms(keys1, counts1, keys2, counts2):
+    """Expand two sorted histograms onto their union of keys, with zero counts where absent"""
+    all_keys = np.union1d(keys1, keys2)
+    aligned1 = np.zeros(len(all_keys), dtype=counts1.dtype)
+    aligned2 = np.zeros(len(all_keys), dtype=counts2.dtype)
+    aligned1[np.searchsorted(all_keys, keys1)] = counts1
+    aligned2[np.searchsorted(all_keys, keys2)] = counts2
+    return all_keys, aligned1, aligned2
 
 def analyze_files(file1, file2):
     print(f"Reading {file1}...")
-    coords1 = read_atom_sites(file1)
+    types1, coords1 = read_atom_sites(file1)
     print(f"Reading {file2}...")
-    coords2 = read_atom_sites(file2)
+    types2, coords2 = read_atom_sites(file2)
     
-    # Count atom types
-    atom_types1 = defaultdict(int)
-    atom_types2 = defaultdict(int)
+    # Encode atom types once for both files; every later step works on the codes
+    type_names, (codes1, codes2) = encode_types(types1, types2)
     
-    for atom_type, _ in coords1:
-        atom_types1[atom_type] += 1
-    
-    for atom_type, _ in coords2:
-        atom_types2[atom_type] += 1
+    # Count atom types
+    atom_types1 = count_atom_types(codes1, type_names)
+    atom_types2 = count_atom_types(codes2, type_names)
     
     print(f"File 1: {file1}")
     print(f"Total atoms: {len(coords1)}")
@@ -57,54 +142,49 @@ def analyze_files(file1, file2):
     
     # Build coordinate histograms
     print("\nBuilding coordinate histograms...")
-    hist1 = build_coordinate_histogram(coords1)
-    hist2 = build_coordinate_histogram(coords2)
+    keys1, counts1 = build_coordinate_histogram(codes1, coords1, n_types=len(type_names))
+    keys2, counts2 = build_coordinate_histogram(codes2, coords2, n_types=len(type_names))
     
     # Compare distributions
     print("Comparing distributions...")
-    all_keys = set(hist1.keys()) | set(hist2.keys())
-    differences = []
-    
-    for key in all_keys:
-        if hist1.get(key, 0) != hist2.get(key, 0):
-            differences.append((key, hist1.get(key, 0), hist2.get(key, 0)))
+    all_keys, all_counts1, all_counts2 = align_histograms(keys1, counts1, keys2, counts2)
+    differs = all_counts1 != all_counts2
+    diff_keys = all_keys[differs]
+    diff_counts1 = all_counts1[differs]
+    diff_counts2 = all_counts2[differs]
     
     # Analyze differences by atom type
-    diff_by_type = defaultdict(int)
-    for (atom_type, _), count1, count2 in differences:
-        diff_by_type[atom_type] += abs(count1 - count2)
+    diff_by_type = np.bincount(diff_keys >> TYPE_SHIFT, weights=np.abs(diff_counts1 - diff_counts2),
+                               minlength=len(type_names)).astype(np.int64)
     
-    if differences:
+    if len(diff_keys):
         print("\nDifferences found in coordinate distributions:")
         print("Atom Type | Coordinate Differences")
         print("-" * 40)
-        for atom_type, diff_count in diff_by_type.items():
-            print(f"{atom_type:8} | {diff_count}")
+        for code in np.flatnonzero(diff_by_type):
+            print(f"{type_names[code]:8} | {diff_by_type[code]}")
         
         # Sample of specific differences
-        if len(differences) > 0:
-            print("\nSample differences (first 5):")
-            for i, ((atom_type, coords), count1, count2) in enumerate(differences[:5]):
-                print(f"{atom_type} at {coords}: {count1} vs {count2}")
+        print("\nSample differences (first 5):")
+        sample_codes, sample_bins = unpack_keys(diff_keys[:5])
+        for code, bins, count1, count2 in zip(sample_codes, sample_bins, diff_counts1[:5], diff_counts2[:5]):
+            coords = tuple((bins * BIN_SIZE).tolist())
+            print(f"{type_names[code]} at {coords}: {count1} vs {count2}")
     else:
         print("\nThe coordinate distributions are identical!")
     
     # Overall similarity
-    common_positions = 0
-    for key in all_keys:
-        common_positions += min(hist1.get(key, 0), hist2.get(key, 0))
+    common_positions = int(np.minimum(all_counts1, all_counts2).sum())
     
-    similarity = common_positions / len(coords1) * 100 if coords1 else 0
+    similarity = common_positions / len(coords1) * 100 if len(coords1) else 0
     print(f"\nOverall structural similarity: {similarity:.2f}%")
 
     # Let's also find some direct coordinate matches
-    direct_matches = 0
-    coords1_set = {(atom_type, coords) for atom_type, coords in coords1}
-    for atom_coords in coords2:
-        if atom_coords in coords1_set:
-            direct_matches += 1
+    direct1 = direct_keys(codes1, coords1)
+    direct2 = direct_keys(codes2, coords2)
+    direct_matches = int(np.isin(direct2, direct1).sum())
     
-    direct_similarity = direct_matches / len(coords1) * 100 if coords1 else 0
+    direct_similarity = direct_matches / len(coords1) * 100 if len(coords1) else 0
     print(f"Direct coordinate matches: {direct_matches}/{len(coords1)} ({direct_similarity:.2f}%)")
 
 # Compare the files
@@ -23,10 +23,25 @@ Date: July 21, 2025
 
 import os
 import sys
+import functools
+import itertools
+from pathlib import Path
+from collections import Counter
 import numpy as np
 import yaml
+from ase import Atoms
 from ase.io import read
 import shutil
+import zipfile
+
+try:
+    from yaml import CSafeLoader as YamlLoader  # libyaml C parser
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# Column layout of the atom_sites files written for zeoran
+ATOM_SITES_DTYPE = [('element', 'U8'), ('label', 'U8'), ('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('charge', 'f8')]
+ATOM_SITES_FORMAT = '%-8s %-6s %.12f %.12f %.12f %-10.6f'
 
 def ensure_directory(path):
     """Create directory if it doesn't exist"""
@@ -34,14 +49,68 @@ def ensure_directory(path):
 
 def read_config_file(config_file):
     """Read configuration from YAML file"""
-    with open(config_file, 'r') as f:
-        config = yaml.safe_load(f)
-    return config
+    # Both generators read the config; resolve the path so every call shares one parse
+    return _load_config(os.path.abspath(config_file))
+
+@functools.lru_cache(maxsize=None)
+def _load_config(config_path):
+    """Parse a YAML config file once per path (the returned dict is shared, do not modify it)"""
+    with open(config_path, 'r') as f:
+        return yaml.load(f, Loader=YamlLoader)
 
-def generate_unit_cell_file(atoms, zeolite_name, output_dir, config_file=None, output_formats='cif'):
-    """Generate unit_cell file from ASE Atoms object with optional config file"""
+def read_structure(cif_file):
+    """Read a CIF file with ASE, reusing a .npz cache of the parsed structure while the CIF is unchanged"""
+    cache_file = cif_file + '.npz'
+    # The cache is keyed by the CIF's exact mtime and size, so a replacement with an older mtime still misses
+    source = os.stat(cif_file)
+    source_key = np.array([source.st_mtime_ns, source.st_size], dtype=np.int64)
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as cache:
+                if 'source_key' in cache and np.array_equal(cache['source_key'], source_key):
+                    atoms = Atoms(numbers=cache['numbers'], positions=cache['positions'],
+                                  cell=cache['cell'], pbc=cache['pbc'])
+                    if 'initial_charges' in cache:
+                        atoms.set_initial_charges(cache['initial_charges'])
+                    print(f"Using cached structure: {cache_file}")
+                    return atoms
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            print(f"Note: Ignoring unreadable structure cache {cache_file}: {e}")
+    
+    # Explicit format skips ASE's file-type sniffing; index=0 parses only the first data block
+    atoms = read(cif_file, format='cif', index=0)
+    # Store exactly what the generators use: Cartesian positions keep the cached structure bit-identical
+    arrays = dict(source_key=source_key, numbers=atoms.numbers, positions=atoms.positions,
+                  cell=atoms.cell.array, pbc=atoms.pbc)
+    if 'initial_charges' in atoms.arrays:
+        arrays['initial_charges'] = atoms.get_initial_charges()
+    # Write to a temporary file and rename it, so an interrupted write never leaves a partial cache
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Note: Could not write structure cache {cache_file}: {e}")
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+    return atoms
+
+def generate_unit_cell_file(atoms, unit_cell_file, config_file=None, output_formats='cif', symbols=None,
+                            atom_counts=None):
+    """Generate unit_cell file from ASE Atoms object with optional config file
+    
+    unit_cell_file is the output path; its directory must already exist.
+    """
+    if symbols is None:
+        symbols = np.asarray(atoms.get_chemical_symbols())
+    if atom_counts is None:
+        atom_counts = Counter(symbols.tolist())
+    
     # Count T-atoms (Si)
-    t_atoms_count = sum(1 for atom in atoms.get_chemical_symbols() if atom == 'Si')
+    t_atoms_count = atom_counts.get('Si', 0)
     
     if t_atoms_count == 0:
         print("WARNING: No silicon (Si) atoms found in the CIF file!")
@@ -84,18 +153,15 @@ def generate_unit_cell_file(atoms, zeolite_name, output_dir, config_file=None, o
     
     # Determine lattice setting
     # This is a simplified approach; could be extended for more complex cases
-    setting = "cubic"
-    if abs(a - b) > 1e-6 or abs(a - c) > 1e-6 or abs(b - c) > 1e-6:
-        setting = "orthorhombic"
-    if abs(alpha - 90) > 1e-6 or abs(beta - 90) > 1e-6 or abs(gamma - 90) > 1e-6:
+    # Check the most general case first; np.ptp is the largest pairwise difference between lengths
+    if not np.allclose([alpha, beta, gamma], 90.0, rtol=0, atol=1e-6):
         setting = "triclinic"  # Most general case
-    
-    # Create unit_cell directory if it doesn't exist
-    unit_cell_dir = os.path.join(output_dir, "unit_cell")
-    ensure_directory(unit_cell_dir)
+    elif np.ptp([a, b, c]) > 1e-6:
+        setting = "orthorhombic"
+    else:
+        setting = "cubic"
     
     # Write to unit_cell file in extended zeoran format
-    unit_cell_file = os.path.join(unit_cell_dir, f"{zeolite_name}.txt")
     with open(unit_cell_file, 'w') as f:
         # Standard zeoran format
         f.write(f"Number of atoms:\t{len(atoms)}\n")
@@ -111,8 +177,8 @@ def generate_unit_cell_file(atoms, zeolite_name, output_dir, config_file=None, o
         
         # Extended format: add charges (extracted from CIF file)
         f.write("\n# Atomic charges\n")
-        symbols = atoms.get_chemical_symbols()
-        unique_symbols = list(set(symbols))
+        # Counter keys are unique and in first-seen order, so the charge lines come out in a stable order
+        unique_symbols = list(atom_counts)
         
         # Try to get charges: config file first (highest priority), then CIF file, then none
         config_charges = {}
@@ -158,31 +224,31 @@ def generate_unit_cell_file(atoms, zeolite_name, output_dir, config_file=None, o
     
     return unit_cell_file
 
-def generate_atom_sites_file(atoms, zeolite_name, output_dir, config_file=None):
-    """Generate atom_sites file from ASE Atoms object with optional config file for charges"""
-    # Create atom_sites directory if it doesn't exist
-    atom_sites_dir = os.path.join(output_dir, "atom_sites")
-    ensure_directory(atom_sites_dir)
+def generate_atom_sites_file(atoms, atom_sites_file, config_file=None, symbols=None, atom_counts=None):
+    """Generate atom_sites file from ASE Atoms object with optional config file for charges
+    
+    atom_sites_file is the output path; its directory must already exist.
+    """
     
     # Get fractional coordinates and symbols
     positions = atoms.get_scaled_positions()
-    symbols = atoms.get_chemical_symbols()
+    if symbols is None:
+        symbols = np.asarray(atoms.get_chemical_symbols())
     
     # Validate positions - check for NaN or out-of-bounds values
-    for i, pos in enumerate(positions):
-        for j, coord in enumerate(pos):
-            if np.isnan(coord) or coord < -0.1 or coord > 1.1:  # Allow slight deviation from [0,1]
-                print(f"WARNING: Potentially invalid fractional coordinate at atom {i}: {pos}")
-                # Fix the coordinate to be within [0,1]
-                positions[i][j] = positions[i][j] % 1.0
+    invalid = np.isnan(positions) | (positions < -0.1) | (positions > 1.1)  # Allow slight deviation from [0,1]
+    if invalid.any():
+        for i in np.flatnonzero(invalid.any(axis=1)):
+            print(f"WARNING: Potentially invalid fractional coordinate at atom {i}: {positions[i]}")
+        # Fix the coordinates to be within [0,1]
+        positions[invalid] %= 1.0
     
     # Count atom types
-    atom_counts = {}
-    for symbol in symbols:
-        if symbol in atom_counts:
-            atom_counts[symbol] += 1
-        else:
-            atom_counts[symbol] = 1
+    if atom_counts is None:
+        atom_counts = Counter(symbols.tolist())
+    
+    # Encode atom types as integer codes into unique_symbols
+    unique_symbols, symbol_codes = np.unique(symbols, return_inverse=True)
     
     # Get charges from config file first (highest priority), then CIF file, then none
     charges = []
@@ -202,11 +268,10 @@ def generate_atom_sites_file(atoms, zeolite_name, output_dir, config_file=None):
     
     # If we have config charges, use them
     if config_charges:
-        charges = [0.0] * len(atoms)  # Initialize with zeros
-        symbols = atoms.get_chemical_symbols()
-        for i, symbol in enumerate(symbols):
-            if symbol in config_charges:
-                charges[i] = config_charges[symbol]
+        # One charge per atom type (zero if not in the config), expanded to atoms by type code
+        charge_lookup = np.fromiter((config_charges.get(symbol, 0.0) for symbol in unique_symbols.tolist()),
+                                    dtype=np.float64, count=len(unique_symbols))
+        charges = charge_lookup[symbol_codes]
     # Otherwise, check if CIF file has charges
     elif 'initial_charges' in atoms.arrays:
         charges = atoms.get_initial_charges()
@@ -214,22 +279,29 @@ def generate_atom_sites_file(atoms, zeolite_name, output_dir, config_file=None):
         print("Using charges from CIF file for atom_sites")
     # No charges available from either source
     else:
-        charges = [0.0] * len(atoms)  # Use zeros as placeholders
+        charges = np.zeros(len(atoms))  # Use zeros as placeholders
         charge_source = "No charges available - using zeros"
         print("Note: No charge information found in CIF file or config - using zeros")
     
     # Write to atom_sites file
-    atom_sites_file = os.path.join(atom_sites_dir, f"{zeolite_name}.txt")
-    with open(atom_sites_file, 'w') as f:
-        # Exact format matching the original FAU.txt file:
-        # Si       Si     0.946080000000     0.125300000000     0.035890000000     2.05       
-        for i in range(len(atoms)):
-            # Format: element(8 chars) element(6 chars) x(17 chars) y(17 chars) z(17 chars) charge(10 chars)
-            f.write(f"{symbols[i]:<8} {symbols[i]:<6} {positions[i][0]:.12f} {positions[i][1]:.12f} {positions[i][2]:.12f} {charges[i]:<10.6f}\n")
+    rows = np.empty(len(atoms), dtype=ATOM_SITES_DTYPE)
+    rows['element'] = symbols
+    rows['label'] = symbols
+    rows['x'], rows['y'], rows['z'] = positions.T
+    rows['charge'] = charges
+    # Exact format matching the original FAU.txt file:
+    # Si       Si     0.946080000000     0.125300000000     0.035890000000     2.05       
+    # Format: element(8 chars) element(6 chars) x(17 chars) y(17 chars) z(17 chars) charge(10 chars)
+    # A single % over the repeated row format renders the whole file, which is written in one call;
+    # encoding it up front and writing in binary mode bypasses the text I/O layer
+    line_format = ATOM_SITES_FORMAT + '\n'
+    contents = (line_format * len(rows)) % tuple(itertools.chain.from_iterable(rows.tolist()))
+    with open(atom_sites_file, 'wb') as f:
+        f.write(contents.encode('ascii'))
     
     print(f"Generated atom sites file: {atom_sites_file}")
     print(f"  Total atoms: {len(atoms)}")
-    print(f"  Atom types: {atom_counts}")
+    print(f"  Atom types: {dict(atom_counts)}")
     print(f"  Charge assignment: {charge_source}")
     
     # Validate the ratio of Si:O which should be approximately 1:2 in zeolites
@@ -249,15 +321,16 @@ def copy_cif_file(cif_path, zeolite_name, output_dir):
     print(f"Using CIF file: {cif_path}")
     print(f"Note: CIF file was not copied to keep cif_files directory for inputs only.")
 
-def validate_structure(atoms, unit_cell_file, atom_sites_file):
+def validate_structure(atoms, unit_cell_file, atom_sites_file, atom_counts=None):
     """Perform validation checks on the generated structure files"""
     print("\nValidating structure...")
     
     # Check if this is really a zeolite structure
-    symbols = atoms.get_chemical_symbols()
-    si_count = symbols.count('Si')
-    o_count = symbols.count('O')
-    al_count = symbols.count('Al')
+    if atom_counts is None:
+        atom_counts = Counter(atoms.get_chemical_symbols())
+    si_count = atom_counts.get('Si', 0)
+    o_count = atom_counts.get('O', 0)
+    al_count = atom_counts.get('Al', 0)
     
     warnings = []
     
@@ -280,11 +353,13 @@ def validate_structure(atoms, unit_cell_file, atom_sites_file):
         warnings.append(f"Structure already contains {al_count} aluminum atoms. Zeoran may behave unexpectedly.")
     
     # 5. Check file sizes
-    if os.path.getsize(unit_cell_file) < 50:
-        warnings.append(f"Unit cell file is unusually small ({os.path.getsize(unit_cell_file)} bytes).")
+    unit_cell_size = os.path.getsize(unit_cell_file)
+    if unit_cell_size < 50:
+        warnings.append(f"Unit cell file is unusually small ({unit_cell_size} bytes).")
     
-    if os.path.getsize(atom_sites_file) < 50:
-        warnings.append(f"Atom sites file is unusually small ({os.path.getsize(atom_sites_file)} bytes).")
+    atom_sites_size = os.path.getsize(atom_sites_file)
+    if atom_sites_size < 50:
+        warnings.append(f"Atom sites file is unusually small ({atom_sites_size} bytes).")
     
     # Print warnings if any
     if warnings:
@@ -323,7 +398,7 @@ def main():
     
     print(f"Reading CIF file: {cif_file}")
     try:
-        atoms = read(cif_file)
+        atoms = read_structure(cif_file)
     except Exception as e:
         print(f"Error reading CIF file: {e}")
         sys.exit(1)
@@ -336,13 +411,24 @@ def main():
     else:
         print("No config file specified - using CIF data only")
     
+    # Extract and count the chemical symbols once and share them between the generators and validation
+    symbols = np.asarray(atoms.get_chemical_symbols())
+    atom_counts = Counter(symbols.tolist())
+    
+    # Resolve the output files once and create their directories up front
+    output_path = Path(output_dir)
+    unit_cell_file = output_path / "unit_cell" / f"{zeolite_name}.txt"
+    atom_sites_file = output_path / "atom_sites" / f"{zeolite_name}.txt"
+    for output_file in (unit_cell_file, atom_sites_file):
+        ensure_directory(output_file.parent)
+    
     # Generate required files
-    unit_cell_file = generate_unit_cell_file(atoms, zeolite_name, output_dir, config_file, output_formats)
-    atom_sites_file = generate_atom_sites_file(atoms, zeolite_name, output_dir, config_file)
+    generate_unit_cell_file(atoms, unit_cell_file, config_file, output_formats, symbols, atom_counts)
+    generate_atom_sites_file(atoms, atom_sites_file, config_file, symbols, atom_counts)
     copy_cif_file(cif_file, zeolite_name, output_dir)  # Now just logs info, doesn't copy
     
     # Validate the generated files
-    validate_structure(atoms, unit_cell_file, atom_sites_file)
+    validate_structure(atoms, unit_cell_file, atom_sites_file, atom_counts)
     
     print("\nPreprocessing complete!")
     print(f"\nNext steps:")
@@ -16,53 +16,93 @@ Options:
 
 import sys
 import argparse
-from collections import defaultdict
+import warnings
+import numpy as np
+
+# Atom type names fill at most ATOM_TYPE_WIDTH - 1 characters, so a full field means it was cut off
+ATOM_TYPE_WIDTH = 32
+ATOM_SITES_DTYPE = [('atom_type', f'U{ATOM_TYPE_WIDTH}'), ('x', 'f8'), ('y', 'f8'), ('z', 'f8')]
 
 def read_atom_sites(file_path):
-    """Read atom coordinates from a zeoran atom_sites file"""
-    coordinates = []
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) >= 5:
-                # Extract atom type and coordinates
-                atom_type = parts[0]
-                try:
-                    x, y, z = float(parts[2]), float(parts[3]), float(parts[4])
-                    coordinates.append((atom_type, (x, y, z)))
-                except (ValueError, IndexError):
-                    print(f"Skipping malformed line: {line.strip()}")
-    return coordinates
+    """Read atom types and coordinates from a zeoran atom_sites file as (atom_types, coords) arrays"""
+    try:
+        data = np.loadtxt(file_path, usecols=(0, 2, 3, 4), dtype=ATOM_SITES_DTYPE, ndmin=1,
+                          comments=None)
+    except ValueError:
+        # Malformed rows: let genfromtxt drop short lines and mark bad floats as NaN
+        # Bad values are reported below and short rows are skipped silently, as before, so hide
+        # genfromtxt's ConversionWarning (a UserWarning that NumPy only exposes from a private module)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='Some errors were detected', category=UserWarning)
+            data = np.atleast_1d(np.genfromtxt(file_path, usecols=(0, 2, 3, 4), dtype=ATOM_SITES_DTYPE,
+                                               encoding='utf-8', comments=None, invalid_raise=False))
+    atom_types = np.ascontiguousarray(data['atom_type'])
+    if len(atom_types) and np.char.str_len(atom_types).max() >= ATOM_TYPE_WIDTH:
+        raise ValueError(f"Atom type names in {file_path} are longer than {ATOM_TYPE_WIDTH - 1} characters")
+    coords = np.column_stack((data['x'], data['y'], data['z']))
+    valid = ~np.isnan(coords).any(axis=1)
+    if not valid.all():
+        print(f"Skipping {np.count_nonzero(~valid)} malformed line(s) in {file_path}")
+        atom_types, coords = atom_types[valid], coords[valid]
+    return atom_types, coords
+
+def encode_atom_types(*atom_type_arrays):
+    """Sorted table of atom type names shared by all inputs, plus integer type ids for each input"""
+    type_names, type_ids = np.unique(np.concatenate(atom_type_arrays), return_inverse=True)
+    return type_names, np.split(type_ids, np.cumsum([len(types) for types in atom_type_arrays[:-1]]))
+
+def build_coordinate_histogram(type_ids, coords, bin_size=0.01):
+    """Group coordinates into bins to compare distributions
+    
+    Returns the occupied (type_id, ix, iy, iz) rows in lexicographic order and the
+    number of atoms in each. Integer bin indices avoid float equality issues.
+    """
+    binned = np.round(coords / bin_size).astype(np.int64)
+    rows = np.column_stack((type_ids, binned))
+    return np.unique(rows, axis=0, return_counts=True)
 
-def build_coordinate_histogram(coordinates, bin_size=0.01):
-    """Group coordinates into bins to compare distributions"""
-    histogram = defaultdict(int)
-    for atom_type, (x, y, z) in coordinates:
-        # Round coordinates to create bins
-        binned_coords = (round(x/bin_size)*bin_size, 
-                        round(y/bin_size)*bin_size, 
-                        round(z/bin_size)*bin_size)
-        # Store as atom_type + coordinates
-        key = (atom_type, binned_coords)
-        histogram[key] += 1
-    return histogram
+def as_records(rows):
+    """View the rows of a 2D integer array as single structured elements so set routines compare whole rows"""
+    rows = np.ascontiguousarray(rows)
+    return rows.view([('', rows.dtype)] * rows.shape[1]).ravel()
+
+def diff_histograms(bins1, counts1, bins2, counts2):
+    """Find the bins whose counts differ between two histograms
+    
+    Returns the differing bin rows (in lexicographic order), their counts in each
+    histogram, and the number of atoms the two histograms have in common.
+    """
+    # Matching structures give identical sorted histograms; skip the set operations
+    if np.array_equal(bins1, bins2) and np.array_equal(counts1, counts2):
+        return bins1[:0], counts1[:0], counts2[:0], int(counts1.sum())
+    _, idx1, idx2 = np.intersect1d(as_records(bins1), as_records(bins2), assume_unique=True, return_indices=True)
+    shared1, shared2 = counts1[idx1], counts2[idx2]
+    mismatched = shared1 != shared2
+    only1 = np.ones(len(bins1), dtype=bool)
+    only1[idx1] = False
+    only2 = np.ones(len(bins2), dtype=bool)
+    only2[idx2] = False
+    
+    diff_bins = np.concatenate((bins1[idx1][mismatched], bins1[only1], bins2[only2]))
+    diff_counts1 = np.concatenate((shared1[mismatched], counts1[only1], np.zeros(only2.sum(), dtype=counts2.dtype)))
+    diff_counts2 = np.concatenate((shared2[mismatched], np.zeros(only1.sum(), dtype=counts1.dtype), counts2[only2]))
+    order = np.lexsort(diff_bins.T[::-1])
+    common = int(np.minimum(shared1, shared2).sum())
+    return diff_bins[order], diff_counts1[order], diff_counts2[order], common
 
 def compare_structures(file1, file2, bin_size=0.01, verbose=False):
     """Compare two structure files and return similarity metrics"""
     print(f"Reading {file1}...")
-    coords1 = read_atom_sites(file1)
+    types1, coords1 = read_atom_sites(file1)
     print(f"Reading {file2}...")
-    coords2 = read_atom_sites(file2)
-    
-    # Count atom types
-    atom_types1 = defaultdict(int)
-    atom_types2 = defaultdict(int)
-    
-    for atom_type, _ in coords1:
-        atom_types1[atom_type] += 1
+    types2, coords2 = read_atom_sites(file2)
     
-    for atom_type, _ in coords2:
-        atom_types2[atom_type] += 1
+    # Map atom types to ids shared by both files, then count atom types
+    type_names, (type_ids1, type_ids2) = encode_atom_types(types1, types2)
+    counts1 = np.bincount(type_ids1, minlength=len(type_names))
+    counts2 = np.bincount(type_ids2, minlength=len(type_names))
+    atom_types1 = {name: count for name, count in zip(type_names.tolist(), counts1.tolist()) if count}
+    atom_types2 = {name: count for name, count in zip(type_names.tolist(), counts2.tolist()) if count}
     
     print(f"File 1: {file1}")
     print(f"Total atoms: {len(coords1)}")
@@ -80,44 +120,35 @@ def compare_structures(file1, file2, bin_size=0.01, verbose=False):
     
     # Build coordinate histograms
     print("\nBuilding coordinate histograms (bin size: {})...".format(bin_size))
-    hist1 = build_coordinate_histogram(coords1, bin_size)
-    hist2 = build_coordinate_histogram(coords2, bin_size)
+    bins1, bin_counts1 = build_coordinate_histogram(type_ids1, coords1, bin_size)
+    bins2, bin_counts2 = build_coordinate_histogram(type_ids2, coords2, bin_size)
     
     # Compare distributions
     print("Comparing distributions...")
-    all_keys = set(hist1.keys()) | set(hist2.keys())
-    differences = []
-    
-    for key in all_keys:
-        if hist1.get(key, 0) != hist2.get(key, 0):
-            differences.append((key, hist1.get(key, 0), hist2.get(key, 0)))
+    diff_bins, diff_counts1, diff_counts2, common_positions = diff_histograms(bins1, bin_counts1, bins2, bin_counts2)
     
     # Analyze differences by atom type
-    diff_by_type = defaultdict(int)
-    for (atom_type, _), count1, count2 in differences:
-        diff_by_type[atom_type] += abs(count1 - count2)
+    diff_by_type = np.bincount(diff_bins[:, 0], weights=np.abs(diff_counts1 - diff_counts2),
+                               minlength=len(type_names)).astype(np.int64)
     
-    if differences:
+    if len(diff_bins):
         print("\nDifferences found in coordinate distributions:")
         print("Atom Type | Coordinate Differences")
         print("-" * 40)
-        for atom_type, diff_count in sorted(diff_by_type.items()):
-            print(f"{atom_type:8} | {diff_count}")
+        for type_id in np.flatnonzero(diff_by_type):
+            print(f"{type_names[type_id]:8} | {diff_by_type[type_id]}")
         
         # Sample of specific differences
-        if verbose and len(differences) > 0:
+        if verbose:
             print("\nSample differences (up to 5):")
-            for i, ((atom_type, coords), count1, count2) in enumerate(differences[:5]):
-                print(f"{atom_type} at {coords}: {count1} vs {count2}")
+            for (type_id, *bin_index), count1, count2 in zip(diff_bins[:5].tolist(), diff_counts1[:5], diff_counts2[:5]):
+                coords = tuple(index * bin_size for index in bin_index)
+                print(f"{type_names[type_id]} at {coords}: {count1} vs {count2}")
     else:
         print("\nThe coordinate distributions are identical!")
     
     # Overall similarity
-    common_positions = 0
-    for key in all_keys:
-        common_positions += min(hist1.get(key, 0), hist2.get(key, 0))
-    
-    similarity = common_positions / len(coords1) * 100 if coords1 else 0
+    similarity = common_positions / len(coords1) * 100 if len(coords1) else 0
     print(f"\nOverall structural similarity: {similarity:.2f}%")
 
     return similarity == 100.0